@@ -10,3 +10,4 @@ from . import product_template
 from . import sale_order
 from . import shopify_refund
 from . import pos_config
+from . import res_partner
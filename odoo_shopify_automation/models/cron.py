@@ -1,4 +1,5 @@
 from odoo import models, fields, api
+from collections import defaultdict
 from datetime import datetime
 
 
@@ -19,13 +20,24 @@ class ShopifyCron(models.Model):
   last_run = fields.Datetime('Last Run')
   note = fields.Text('Notes')
 
+  # cron_type -> (model, import method taking a single shopify.instance)
+  _DISPATCH = {
+      'import_product': ('shopify.product', 'import_products_from_shopify'),
+      'import_order': ('shopify.order', 'import_orders_from_shopify'),
+      'import_customer': ('shopify.customer', 'import_customers_from_shopify'),
+  }
+
   def run_cron(self):
+    # Group instances per cron type so each importer runs once per instance
+    instances_by_type = defaultdict(lambda: self.env['shopify.instance'])
     for cron in self:
-      if cron.cron_type == 'import_product':
-        self.env['shopify.product'].import_products_from_shopify(cron.instance_id)
-      elif cron.cron_type == 'import_order':
-        self.env['shopify.order'].import_orders_from_shopify(cron.instance_id)
-      elif cron.cron_type == 'import_customer':
-        self.env['shopify.customer'].import_customers_from_shopify(cron.instance_id)
+      instances_by_type[cron.cron_type] |= cron.instance_id
+
+    for cron_type, instances in instances_by_type.items():
+      model_name, method_name = self._DISPATCH[cron_type]
+      import_method = getattr(self.env[model_name], method_name)
+      for instance in instances:
+        import_method(instance)
 
-      cron.last_run = fields.Datetime.now()
+    # Stamp the crons once all their imports have finished
+    self.write({'last_run': fields.Datetime.now()})
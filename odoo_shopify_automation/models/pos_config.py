@@ -14,5 +14,6 @@ class PosConfig(models.Model):
   def _notify_shopify_orders(self, channel, data):
     """Notify all open POS sessions about new Shopify orders"""
     pos_sessions = self.env["pos.session"].search([("state", "!=", "closed")])
-    for session in pos_sessions:
-      session.config_id._notify(channel, data)
+    # Several sessions can share a config, notify each config only once
+    for config in pos_sessions.mapped('config_id'):
+      config._notify(channel, data)
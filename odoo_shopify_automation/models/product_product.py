@@ -1,6 +1,9 @@
 from odoo import models, fields, api
+from collections import defaultdict
 import logging
 
+from .product_template import _SYNC_FIELDS, _filter_shopify_changed
+
 _logger = logging.getLogger(__name__)
 
 
@@ -10,7 +13,6 @@ class ProductProduct(models.Model):
   default_code = fields.Char(
       required=False,
       default="/",
-      tracking=True,
       help="Set to '/' and save if you want a new internal reference "
       "to be proposed.",
   )
@@ -37,73 +39,103 @@ class ProductProduct(models.Model):
     products = super().create(vals_list)
 
     # Check for auto-sync settings
-    for product in products:
-      if product.shopify_sync_enabled:
-        self._create_shopify_mappings(product)
+    to_map = products.filtered('shopify_sync_enabled')
+    if to_map:
+      Instance = self.env['shopify.instance']
+      active_instances = Instance.browse(Instance._get_connected_instance_ids())
+      self._create_shopify_mappings(to_map, active_instances)
 
     return products
 
   def write(self, vals):
     """Override write to sync changes to Shopify if mappings exist"""
+    # Compare against the current values before writing, so that resaving
+    # identical values does not flag the mappings for re-export
+    changed = self.browse()
+    if not _SYNC_FIELDS.isdisjoint(vals):
+      # Only sync-enabled records can need a resync, skip the comparison for the others
+      candidates = self if vals.get('shopify_sync_enabled') else self.filtered(
+          'shopify_sync_enabled')
+      if candidates:
+        changed = _filter_shopify_changed(candidates, vals, _SYNC_FIELDS)
+
     result = super().write(vals)
 
     # If shopify_sync_enabled is being turned on, create mappings
     if vals.get('shopify_sync_enabled'):
-      for product in self:
-        self._create_shopify_mappings(product)
+      self._create_shopify_mappings(self)
 
     # If product details are updated and sync is enabled, mark for re-export
-    sync_fields = ['name', 'list_price', 'default_code', 'description', 'active', 'image_1920']
-    if any(field in vals for field in sync_fields):
-      for product in self:
-        if product.shopify_sync_enabled:
-          self._mark_for_resync(product)
+    to_resync = changed.filtered('shopify_sync_enabled')
+    if to_resync:
+      self._mark_for_resync(to_resync)
 
     return result
 
-  def _create_shopify_mappings(self, product):
+  def _create_shopify_mappings(self, products, active_instances=None):
     """Create Shopify product mappings for all active instances"""
-    active_instances = self.env['shopify.instance'].search([('active', '=', True),
-                                                            ('state', '=', 'connected')])
-
-    for instance in active_instances:
-      # Check if mapping already exists
-      existing_mapping = self.env['shopify.product'].search([('odoo_product_id', '=', product.id),
-                                                             ('instance_id', '=', instance.id)],
-                                                            limit=1)
-
-      if not existing_mapping:
+    if active_instances is None:
+      Instance = self.env['shopify.instance']
+      active_instances = Instance.browse(Instance._get_connected_instance_ids())
+    if not active_instances or not products:
+      return
+
+    # Fetch all existing mappings at once instead of probing each instance.
+    # Plain SQL is enough here, this only decides which pairs still need a mapping.
+    self.env['shopify.product'].flush_model(['odoo_product_id', 'instance_id'])
+    self.env.cr.execute(
+        """SELECT odoo_product_id, instance_id FROM shopify_product
+           WHERE odoo_product_id = ANY(%s) AND instance_id = ANY(%s)""",
+        (products.ids, active_instances.ids))
+    existing_set = set(self.env.cr.fetchall())
+    # Read all names in one go, name is delegated to product.template via _inherits
+    name_by_product = dict(zip(products.ids, products.mapped('name')))
+
+    log_info = _logger.isEnabledFor(logging.INFO)
+    vals_list = []
+    for product in products:
+      for instance in active_instances:
+        if (product.id, instance.id) in existing_set:
+          continue
         # Create mapping with pending status
-        self.env['shopify.product'].create({
-            'name': product.name,
+        vals_list.append({
+            'name': name_by_product[product.id],
             'shopify_product_id': '',  # Will be filled after export
             'odoo_product_id': product.id,
             'instance_id': instance.id,
             'sync_status': 'pending',
         })
 
-        _logger.info(
-            f"Created pending Shopify mapping for product {product.name} on instance {instance.name}"
-        )
+        if log_info:
+          _logger.info("Created pending Shopify mapping for product %s on instance %s",
+                       name_by_product[product.id], instance.name)
 
-  def _mark_for_resync(self, product):
+    if vals_list:
+      self.env['shopify.product'].create(vals_list)
+
+  def _mark_for_resync(self, products):
     """Mark existing Shopify mappings for re-sync"""
-    mappings = self.env['shopify.product'].search([('odoo_product_id', '=', product.id)])
+    all_mappings = self.env['shopify.product'].search([('odoo_product_id', 'in', products.ids)])
+
+    mappings_by_product = defaultdict(lambda: self.env['shopify.product'])
+    for mapping in all_mappings:
+      mappings_by_product[mapping.odoo_product_id.id] |= mapping
 
-    for mapping in mappings:
-      mapping.write({
+    for product in products:
+      mappings = mappings_by_product.get(product.id)
+      if not mappings:
+        continue
+
+      mappings.write({
           'sync_status': 'pending',
           'name': product.name,  # Update the mapping name too
       })
-
-    if mappings:
-      _logger.info(
-          f"Marked {len(mappings)} Shopify mappings for re-sync for product {product.name}")
+      _logger.info("Marked %s Shopify mappings for re-sync for product %s", len(mappings),
+                   product.name)
 
   def action_enable_shopify_sync(self):
     """Action to enable Shopify sync for selected products"""
-    for product in self:
-      product.shopify_sync_enabled = True
+    self.write({'shopify_sync_enabled': True})
 
     return {
         'type': 'ir.actions.client',
@@ -122,8 +154,7 @@ class ProductProduct(models.Model):
 
   def action_disable_shopify_sync(self):
     """Action to disable Shopify sync for selected products"""
-    for product in self:
-      product.shopify_sync_enabled = False
+    self.write({'shopify_sync_enabled': False})
 
     return {
         'type': 'ir.actions.client',
@@ -3,6 +3,31 @@ import logging
 
 _logger = logging.getLogger(__name__)
 
+# Fields whose changes must be pushed again to Shopify
+_SYNC_FIELDS = frozenset(
+    ('name', 'list_price', 'default_code', 'description', 'active', 'image_1920'))
+
+
+def _filter_shopify_changed(records, vals, field_names):
+  """Return the records for which ``vals`` actually changes one of ``field_names``"""
+  fnames = [fname for fname in field_names if fname in vals]
+  if not fnames:
+    return records.browse()
+  # Stored images are resized versions of the upload, so they never compare equal;
+  # count any new image as a change rather than loading every blob to compare it
+  if 'image_1920' in fnames:
+    return records
+
+  def _is_changed(record):
+    for fname in fnames:
+      field = record._fields[fname]
+      new_value = field.convert_to_record(field.convert_to_cache(vals[fname], record), record)
+      if record[fname] != new_value:
+        return True
+    return False
+
+  return records.filtered(_is_changed)
+
 
 class ProductTemplate(models.Model):
   _inherit = 'product.template'
@@ -37,80 +62,55 @@ class ProductTemplate(models.Model):
     templates = super().create(vals_list)
 
     # Check for auto-sync settings
-    for template in templates:
-      if template.shopify_sync_enabled:
-        self._create_shopify_mappings(template)
+    to_map = templates.filtered('shopify_sync_enabled')
+    if to_map:
+      Instance = self.env['shopify.instance']
+      active_instances = Instance.browse(Instance._get_connected_instance_ids())
+      self._create_shopify_mappings(to_map, active_instances)
 
     return templates
 
   def write(self, vals):
     """Override write to sync changes to Shopify if mappings exist"""
+    # Compare against the current values before writing, so that resaving
+    # identical values does not flag the mappings for re-export
+    changed = self.browse()
+    if not _SYNC_FIELDS.isdisjoint(vals):
+      # Only sync-enabled records can need a resync, skip the comparison for the others
+      candidates = self if vals.get('shopify_sync_enabled') else self.filtered(
+          'shopify_sync_enabled')
+      if candidates:
+        changed = _filter_shopify_changed(candidates, vals, _SYNC_FIELDS)
+
     result = super().write(vals)
 
     # If shopify_sync_enabled is being turned on, create mappings
     if vals.get('shopify_sync_enabled'):
-      for template in self:
-        self._create_shopify_mappings(template)
+      self._create_shopify_mappings(self)
 
     # If product template details are updated and sync is enabled, mark for re-export
-    sync_fields = ['name', 'list_price', 'default_code', 'description', 'active', 'image_1920']
-    if any(field in vals for field in sync_fields):
-      for template in self:
-        if template.shopify_sync_enabled:
-          self._mark_for_resync(template)
+    to_resync = changed.filtered('shopify_sync_enabled')
+    if to_resync:
+      self._mark_for_resync(to_resync)
 
     return result
 
-  def _create_shopify_mappings(self, template):
+  def _create_shopify_mappings(self, templates, active_instances=None):
     """Create Shopify product mappings for all active instances for all variants"""
-    active_instances = self.env['shopify.instance'].search([('active', '=', True),
-                                                            ('state', '=', 'connected')])
-
-    for instance in active_instances:
-      # Create mappings for all product variants of this template
-      for product in template.product_variant_ids:
-        # Check if mapping already exists
-        existing_mapping = self.env['shopify.product'].search([('odoo_product_id', '=', product.id),
-                                                               ('instance_id', '=', instance.id)],
-                                                              limit=1)
-
-        if not existing_mapping:
-          # Create mapping with pending status
-          self.env['shopify.product'].create({
-              'name': product.name,
-              'shopify_product_id': '',  # Will be filled after export
-              'odoo_product_id': product.id,
-              'instance_id': instance.id,
-              'sync_status': 'pending',
-          })
-
-          _logger.info(
-              f"Created pending Shopify mapping for product variant {product.name} (template: {template.name}) on instance {instance.name}"
-          )
-
-  def _mark_for_resync(self, template):
+    if active_instances is None:
+      Instance = self.env['shopify.instance']
+      active_instances = Instance.browse(Instance._get_connected_instance_ids())
+    # Mappings are per variant, product.product holds the shared implementation
+    self.env['product.product']._create_shopify_mappings(templates.product_variant_ids,
+                                                         active_instances)
+
+  def _mark_for_resync(self, templates):
     """Mark existing Shopify mappings for re-sync for all variants"""
-    for product in template.product_variant_ids:
-      mappings = self.env['shopify.product'].search([('odoo_product_id', '=', product.id)])
-
-      for mapping in mappings:
-        mapping.write({
-            'sync_status': 'pending',
-            'name': product.name,  # Update the mapping name too
-        })
-
-    total_mappings = sum(
-        len(self.env['shopify.product'].search([('odoo_product_id', '=', p.id)]))
-        for p in template.product_variant_ids)
-
-    if total_mappings:
-      _logger.info(
-          f"Marked {total_mappings} Shopify mappings for re-sync for template {template.name}")
+    self.env['product.product']._mark_for_resync(templates.product_variant_ids)
 
   def action_enable_shopify_sync(self):
     """Action to enable Shopify sync for selected product templates"""
-    for template in self:
-      template.shopify_sync_enabled = True
+    self.write({'shopify_sync_enabled': True})
 
     return {
         'type': 'ir.actions.client',
@@ -129,8 +129,7 @@ class ProductTemplate(models.Model):
 
   def action_disable_shopify_sync(self):
     """Action to disable Shopify sync for selected product templates"""
-    for template in self:
-      template.shopify_sync_enabled = False
+    self.write({'shopify_sync_enabled': False})
 
     return {
         'type': 'ir.actions.client',
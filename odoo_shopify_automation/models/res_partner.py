@@ -0,0 +1,11 @@
+from odoo import models
+from odoo.tools.sql import create_index
+
+
+class ResPartner(models.Model):
+  _inherit = 'res.partner'
+
+  def init(self):
+    super().init()
+    # Imported Shopify orders are matched to their customer by email, which core leaves unindexed
+    create_index(self._cr, 'shopify_res_partner_email_idx', self._table, ['email'])
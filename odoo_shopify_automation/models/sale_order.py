@@ -5,6 +5,17 @@ import json
 
 _logger = logging.getLogger(__name__)
 
+# Fields whose changes must be pushed again to Shopify
+_SYNC_FIELDS = frozenset(('partner_id', 'order_line', 'amount_total', 'state'))
+# Status fields that may be set from a Shopify payload
+_SHOPIFY_STATUS_FIELDS = frozenset((
+    'shopify_payment_status',
+    'shopify_payment_method',
+    'shopify_fulfillment_status',
+    'shopify_delivery_category',
+    'shopify_delivery_method',
+))
+
 
 class SaleOrder(models.Model):
   _inherit = 'sale.order'
@@ -64,9 +75,10 @@ class SaleOrder(models.Model):
     orders = super().create(vals_list)
 
     # Handle auto-sync for orders created in Odoo
-    for order in orders:
-      if order.shopify_sync_enabled and order.shopify_order_source == 'odoo':
-        self._create_shopify_mappings(order)
+    to_map = orders.filtered(
+        lambda o: o.shopify_sync_enabled and o.shopify_order_source == 'odoo')
+    if to_map:
+      self._create_shopify_mappings(to_map)
 
     return orders
 
@@ -76,47 +88,54 @@ class SaleOrder(models.Model):
 
     # If shopify_sync_enabled is being turned on, create mappings
     if vals.get('shopify_sync_enabled'):
-      for order in self:
-        if order.shopify_order_source == 'odoo':
-          self._create_shopify_mappings(order)
+      to_map = self.filtered(lambda o: o.shopify_order_source == 'odoo')
+      if to_map:
+        self._create_shopify_mappings(to_map)
 
     # If order details are updated and sync is enabled, mark for re-export
-    sync_fields = ['partner_id', 'order_line', 'amount_total', 'state']
-    if any(field in vals for field in sync_fields):
-      for order in self:
-        if order.shopify_sync_enabled and order.shopify_order_source == 'odoo':
-          self._mark_for_resync(order)
+    if not _SYNC_FIELDS.isdisjoint(vals):
+      to_resync = self.filtered(
+          lambda o: o.shopify_sync_enabled and o.shopify_order_source == 'odoo')
+      if to_resync:
+        self._mark_for_resync(to_resync)
 
     return result
 
-  def _create_shopify_mappings(self, order):
+  def _create_shopify_mappings(self, orders, active_instances=None):
     """Create Shopify order mappings for all active instances"""
-    active_instances = self.env['shopify.instance'].search([('active', '=', True),
-                                                            ('state', '=', 'connected')])
+    if active_instances is None:
+      Instance = self.env['shopify.instance']
+      active_instances = Instance.browse(Instance._get_connected_instance_ids())
+    if not active_instances:
+      return
 
-    for instance in active_instances:
-      # Check if mapping already exists
-      existing_mapping = self.env['shopify.order'].search([('odoo_order_id', '=', order.id),
-                                                           ('instance_id', '=', instance.id)],
-                                                          limit=1)
-
-      if not existing_mapping:
-        # Create mapping with pending status
-        self.env['shopify.order'].create({
+    # Fetch the (order, instance) pairs already mapped in one query
+    existing = self.env['shopify.order'].search_read([('odoo_order_id', 'in', orders.ids),
+                                                      ('instance_id', 'in', active_instances.ids)],
+                                                     ['odoo_order_id', 'instance_id'])
+    existing_set = {(r['odoo_order_id'][0], r['instance_id'][0]) for r in existing}
+
+    # Create the missing mappings with pending status
+    vals_list = []
+    for order in orders:
+      for instance in active_instances:
+        if (order.id, instance.id) in existing_set:
+          continue
+        vals_list.append({
             'shopify_order_id': '',  # Will be filled after export
             'odoo_order_id': order.id,
             'instance_id': instance.id,
             'sync_status': 'pending',
         })
+    if vals_list:
+      self.env['shopify.order'].create(vals_list)
 
-  def _mark_for_resync(self, order):
+  def _mark_for_resync(self, orders):
     """Mark existing Shopify mappings for re-sync"""
-    mappings = self.env['shopify.order'].search([('odoo_order_id', '=', order.id)])
-
-    for mapping in mappings:
-      mapping.write({
-          'sync_status': 'pending',
-      })
+    mappings = self.env['shopify.order'].search([('odoo_order_id', 'in', orders.ids)])
+    mappings.write({
+        'sync_status': 'pending',
+    })
 
   def action_enable_shopify_sync(self):
     """Action to enable Shopify sync for selected orders"""
@@ -156,21 +175,14 @@ class SaleOrder(models.Model):
 
   def _set_shopify_status_values(self, status_vals):
     """Utility to update Shopify status helper fields safely."""
-    allowed_keys = {
-        'shopify_payment_status',
-        'shopify_payment_method',
-        'shopify_fulfillment_status',
-        'shopify_delivery_category',
-        'shopify_delivery_method',
-    }
-    filtered_vals = {k: v for k, v in status_vals.items() if k in allowed_keys}
+    filtered_vals = {k: v for k, v in status_vals.items() if k in _SHOPIFY_STATUS_FIELDS}
     if filtered_vals:
       self.write(filtered_vals)
 
   def action_import_from_shopify(self):
     """Action to manually import orders from all Shopify instances"""
-    active_instances = self.env['shopify.instance'].search([('active', '=', True),
-                                                            ('state', '=', 'connected')])
+    Instance = self.env['shopify.instance']
+    active_instances = Instance.browse(Instance._get_connected_instance_ids())
 
     if not active_instances:
       return {
@@ -187,8 +199,8 @@ class SaleOrder(models.Model):
     imported_count = 0
     for instance in active_instances:
       try:
-        orders = self.env['shopify.order'].import_orders_from_shopify(instance)
-        imported_count += len(orders) if orders else 0
+        result = self.env['shopify.order'].import_orders_from_shopify(instance)
+        imported_count += result['total']
       except Exception as e:
         _logger.error(f"Failed to import orders from {instance.name}: {str(e)}")
 
@@ -1,8 +1,10 @@
 from odoo import models, fields, api
-import requests
+import logging
 from odoo.exceptions import UserError
 from odoo.tools.translate import _
 
+_logger = logging.getLogger(__name__)
+
 
 class ShopifyCustomer(models.Model):
   _name = 'shopify.customer'
@@ -11,7 +13,10 @@ class ShopifyCustomer(models.Model):
 
   shopify_customer_id = fields.Char('Shopify Customer ID', required=True)
   odoo_partner_id = fields.Many2one('res.partner', string='Odoo Partner', required=True)
-  instance_id = fields.Many2one('shopify.instance', string='Shopify Instance', required=True)
+  instance_id = fields.Many2one('shopify.instance',
+                                string='Shopify Instance',
+                                required=True,
+                                auto_join=True)
   sync_status = fields.Selection([
       ('synced', 'Synced'),
       ('pending', 'Pending'),
@@ -35,76 +40,129 @@ class ShopifyCustomer(models.Model):
         """
     if not instance:
       raise UserError(_('No Shopify instance provided.'))
-    url = f"{instance.shop_url}/admin/api/2024-01/customers.json"
     try:
-      response = requests.get(url, auth=(instance.api_key, instance.password), timeout=20)
-      if response.status_code == 200:
-        customers = response.json().get('customers', [])
+      # Process each customer
+      now = fields.Datetime.now()
+      created_count = 0
+      updated_count = 0
+      error_count = 0
+
+      # Pages are processed as they arrive so only one page is kept in memory
+      for customers in instance._fetch_pages('2024-01/customers.json', 'customers',
+                                             {'limit': 250}):
+        # Load existing mappings and partners for the whole page up front,
+        # archived mappings included since the upsert below revives them
+        shopify_ids = [str(c['id']) for c in customers]
+        emails = {c['email'] for c in customers if c.get('email')}
+        mapping_by_sid = {
+            mapping.shopify_customer_id: mapping
+            for mapping in self.with_context(active_test=False).search([
+                ('shopify_customer_id', 'in', shopify_ids),
+                ('instance_id', '=', instance.id),
+            ])
+        }
+        partner_by_email = {}
+        for partner in self.env['res.partner'].search([('email', 'in', list(emails))]):
+          partner_by_email.setdefault(partner.email, partner)
 
-        # Process each customer
-        created_count = 0
-        updated_count = 0
-        error_count = 0
+        new_partner_vals = []
+        new_partner_index_by_email = {}
+        # shopify customer id -> partner record, or index in new_partner_vals
+        partner_by_sid = {}
 
         for shopify_customer in customers:
           try:
             # Check if customer already exists
-            existing_mapping = self.search([('shopify_customer_id', '=',
-                                             str(shopify_customer['id'])),
-                                            ('instance_id', '=', instance.id)])
+            existing_mapping = mapping_by_sid.get(str(shopify_customer['id']))
 
             if existing_mapping:
               # Update existing customer
-              odoo_partner = existing_mapping.odoo_partner_id
+              partner_by_sid[existing_mapping.shopify_customer_id] = existing_mapping.odoo_partner_id
               updated_count += 1
-            else:
-              # Create new Odoo partner
-              customer_email = shopify_customer.get('email', '')
-              customer_name = f"{shopify_customer.get('first_name', '')} {shopify_customer.get('last_name', '')}".strip(
-              )
-
-              # Check if partner already exists by email
-              existing_partner = self.env['res.partner'].search([('email', '=', customer_email)],
-                                                                limit=1)
-              if existing_partner:
-                odoo_partner = existing_partner
-              else:
-                odoo_partner = self.env['res.partner'].create({
+              continue
+
+            # Create new Odoo partner
+            customer_email = shopify_customer.get('email', '')
+            customer_name = f"{shopify_customer.get('first_name', '')} {shopify_customer.get('last_name', '')}".strip(
+            )
+
+            # Check if partner already exists by email
+            odoo_partner = partner_by_email.get(customer_email)
+            if not odoo_partner:
+              # Queue the partner creation, customers sharing an email share the partner
+              odoo_partner = new_partner_index_by_email.get(customer_email)
+              if odoo_partner is None:
+                odoo_partner = len(new_partner_vals)
+                new_partner_vals.append({
                     'name': customer_name or 'Unknown Customer',
                     'email': customer_email,
                     'phone': shopify_customer.get('phone', ''),
                     'is_company': False,
                     'customer_rank': 1,
                 })
+                if customer_email:
+                  new_partner_index_by_email[customer_email] = odoo_partner
 
-              created_count += 1
-
-            # Create or update mapping
-            mapping_vals = {
-                'shopify_customer_id': str(shopify_customer['id']),
-                'odoo_partner_id': odoo_partner.id,
-                'instance_id': instance.id,
-                'sync_status': 'synced',
-                'last_sync': fields.Datetime.now(),
-            }
-
-            if existing_mapping:
-              existing_mapping.write(mapping_vals)
-            else:
-              self.create(mapping_vals)
+            partner_by_sid[str(shopify_customer['id'])] = odoo_partner
+            created_count += 1
 
           except Exception as e:
             error_count += 1
 
-        return customers
-      else:
-        raise UserError(_(f'Failed to import customers: {response.text}'))
+        # Create all new partners of the page at once
+        new_partners = self.env['res.partner'].create(new_partner_vals)
+        partner_ids = [
+            new_partners[partner].id if isinstance(partner, int) else partner.id
+            for partner in partner_by_sid.values()
+        ]
+        self._upsert_mappings(instance, list(partner_by_sid), partner_ids, now)
+
+      return {
+          'created': created_count,
+          'updated': updated_count,
+          'errors': error_count,
+      }
     except Exception as e:
       raise UserError(_(f'Exception during customer import: {str(e)}'))
 
+  def _upsert_mappings(self, instance, shopify_customer_ids, partner_ids, sync_date):
+    """Create or refresh the synced mappings of the given customers in one statement"""
+    if not shopify_customer_ids:
+      return
+    # The unique (shopify_customer_id, instance_id) constraint arbitrates concurrent imports,
+    # existing (even archived) mappings keep their partner and only get their status refreshed
+    self.flush_model()
+    self.env.cr.execute(
+        """
+        INSERT INTO shopify_customer (shopify_customer_id, odoo_partner_id, instance_id,
+                                      sync_status, last_sync, active,
+                                      create_uid, create_date, write_uid, write_date)
+             SELECT sid, pid, %(instance_id)s, 'synced', %(now)s, TRUE,
+                    %(uid)s, %(now)s, %(uid)s, %(now)s
+               FROM unnest(%(sids)s::varchar[], %(pids)s::int[]) AS t(sid, pid)
+        ON CONFLICT (shopify_customer_id, instance_id)
+        DO UPDATE SET active = TRUE,
+                      sync_status = EXCLUDED.sync_status,
+                      last_sync = EXCLUDED.last_sync,
+                      write_uid = EXCLUDED.write_uid,
+                      write_date = EXCLUDED.write_date
+        """, {
+            'instance_id': instance.id,
+            'now': sync_date,
+            'uid': self.env.uid,
+            'sids': shopify_customer_ids,
+            'pids': partner_ids,
+        })
+    self.invalidate_model()
+
   @api.model
   def _run_customer_import_cron(self):
     instances = self.env['shopify.instance'].search([('active', '=', True),
                                                      ('state', '=', 'connected')])
     for instance in instances:
-      self.import_customers_from_shopify(instance)
+      # Isolate each shop, so a failing one neither rolls back nor blocks the others
+      try:
+        with self.env.cr.savepoint():
+          self.import_customers_from_shopify(instance)
+      except UserError:
+        _logger.exception('Customer import failed for Shopify instance %s', instance.name)
@@ -1,8 +1,16 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from odoo.exceptions import UserError
 from odoo.tools.translate import _
 
+# Pooled HTTP sessions per (database, instance, retries), reused across Shopify calls.
+# requests sessions are not thread-safe, so every server thread keeps its own.
+_THREAD_SESSIONS = threading.local()
+
 
 class ShopifyInstance(models.Model):
   _name = 'shopify.instance'
@@ -52,6 +60,91 @@ class ShopifyInstance(models.Model):
        'A Shopify instance with this URL already exists for this company!'),
   ]
 
+  @api.model_create_multi
+  def create(self, vals_list):
+    instances = super().create(vals_list)
+    self.env.registry.clear_cache()
+    return instances
+
+  def write(self, vals):
+    result = super().write(vals)
+    # The cached ids depend on these fields, company_id through the multi-company record rules
+    if not {'active', 'state', 'company_id'}.isdisjoint(vals):
+      self.env.registry.clear_cache()
+    return result
+
+  def unlink(self):
+    result = super().unlink()
+    self.env.registry.clear_cache()
+    return result
+
+  @api.model
+  @tools.ormcache('self.env.uid', 'self.env.su', 'tuple(self.env.companies.ids)')
+  def _get_connected_instance_ids(self):
+    """Return the ids of the active, connected instances visible to the current user"""
+    return tuple(self.search([('active', '=', True), ('state', '=', 'connected')]).ids)
+
+  def _get_session(self, max_retries=5):
+    """Return the keep-alive HTTP session of this instance for the calling thread"""
+    self.ensure_one()
+    sessions = getattr(_THREAD_SESSIONS, 'sessions', None)
+    if sessions is None:
+      sessions = _THREAD_SESSIONS.sessions = {}
+    key = (self.env.cr.dbname, self.id, max_retries)
+    credentials = (self.api_key, self.password, self.access_token)
+    cached = sessions.get(key)
+    if cached and cached[0] == credentials:
+      return cached[1]
+
+    session = self._new_session(max_retries)
+    sessions[key] = (credentials, session)
+    return session
+
+  def _new_session(self, max_retries=5):
+    """Return a new keep-alive HTTP session authenticated for this instance"""
+    self.ensure_one()
+    # Retry rate-limited and transient errors, honouring Shopify's Retry-After header
+    retry = Retry(total=max_retries,
+                  backoff_factor=0.5,
+                  status_forcelist=[429, 500, 502, 503, 504],
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=64, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if self.access_token:
+      session.headers['X-Shopify-Access-Token'] = self.access_token
+    else:
+      session.auth = (self.api_key, self.password)
+    return session
+
+  def _fetch_pages(self, path, key, params=None):
+    """Yield the ``key`` records of each page of a REST listing, e.g. ``key='orders'``.
+
+    Pages follow Shopify's Link cursor pagination, rate limits and transient errors are
+    retried by the session itself.
+    """
+    self.ensure_one()
+    url = f"{self.shop_url}/admin/api/{path}"
+    # The next page is downloaded in a worker thread while the caller processes the
+    # current one. Only HTTP runs there, on a session of its own that no other thread
+    # uses; the ORM is only used from the calling thread.
+    with self._new_session() as session, ThreadPoolExecutor(max_workers=1) as executor:
+      future = executor.submit(session.get, url, params=params, timeout=20)
+      while future:
+        try:
+          response = future.result()
+        except requests.RequestException as e:
+          raise UserError(_(f'Failed to fetch {key}: {str(e)}')) from e
+        if response.status_code != 200:
+          raise UserError(
+              _(f'Failed to fetch {key} - HTTP {response.status_code}: {response.text}'))
+
+        # The next page link already carries the page_info cursor and limit
+        url = response.links.get('next', {}).get('url')
+        future = executor.submit(session.get, url, timeout=20) if url else None
+        yield response.json().get(key, [])
+
   def action_test_connection(self):
     self.ensure_one()
     url = f"{self.shop_url}/admin/api/2024-01/shop.json"
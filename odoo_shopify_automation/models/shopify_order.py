@@ -1,8 +1,9 @@
 from odoo import models, fields, api
-import requests
+from datetime import datetime, timezone
 import logging
 from odoo.exceptions import UserError
 from odoo.tools.translate import _
+from odoo.tools.sql import create_index
 
 _logger = logging.getLogger(__name__)
 
@@ -14,7 +15,10 @@ class ShopifyOrder(models.Model):
 
   shopify_order_id = fields.Char('Shopify Order ID', required=True)
   odoo_order_id = fields.Many2one('sale.order', string='Odoo Sale Order', required=True)
-  instance_id = fields.Many2one('shopify.instance', string='Shopify Instance', required=True)
+  instance_id = fields.Many2one('shopify.instance',
+                                string='Shopify Instance',
+                                required=True,
+                                auto_join=True)
   sync_status = fields.Selection(
       [
           ('synced', 'Synced'),
@@ -41,6 +45,13 @@ class ShopifyOrder(models.Model):
        'This Shopify order is already mapped for this instance!'),
   ]
 
+  def init(self):
+    # Serves the numeric "last imported order" lookup of the import cron
+    create_index(self._cr,
+                 'shopify_order_instance_numeric_id_idx',
+                 self._table, ['instance_id', '(shopify_order_id::bigint)'],
+                 where="shopify_order_id ~ '^[0-9]+$'")
+
   def _get_shipping_product(self):
     """Return a service product used to represent Shopify shipping fees."""
     shipping_product = self.env.ref('delivery.product_product_delivery', raise_if_not_found=False)
@@ -96,77 +107,91 @@ class ShopifyOrder(models.Model):
   def import_orders_from_shopify(self, instance, since_id=None):
     if not instance:
       raise UserError(_('No Shopify instance provided.'))
-    base_url = f"{instance.shop_url}/admin/api/2024-10/orders.json"
-    headers = {'Content-Type': 'application/json'}
-    auth = None
-    if getattr(instance, 'access_token', False):
-      headers['X-Shopify-Access-Token'] = instance.access_token
-    else:
-      auth = (instance.api_key, instance.password)
-
+    default_partner = self.env.ref('base.partner_admin')
+    # Orders share a handful of currencies, unknown codes are cached as False
+    currency_by_code = {}
+    config_by_location = {}
+    # Imported records need neither chatter messages nor field tracking
+    import_env = self.with_context(tracking_disable=True,
+                                   mail_create_nolog=True,
+                                   mail_create_nosubscribe=True,
+                                   mail_notrack=True).env
     created_count = 0
-    # updated_count = 0
+    updated_count = 0
     error_count = 0
     total_orders = 0
-    last_id = since_id
-    all_orders = []
 
     # get toda's date
     today_date = fields.Date.context_today(self)
 
-    try:
-      while True:
-        params = {'limit': 250, 'status': 'any', 'created_at_min': today_date}
-        if last_id:
-          params['since_id'] = last_id
-
-        response = requests.get(base_url, headers=headers, auth=auth, params=params, timeout=20)
-
-        if response.status_code != 200:
-          raise UserError(
-              _(f'Failed to import orders - HTTP {response.status_code}: {response.text}'))
-
-        orders_chunk = response.json().get('orders', [])
-        if not orders_chunk:
-          break
-
-        total_orders += len(orders_chunk)
-        all_orders.extend(orders_chunk)
-
-        for shopify_order in orders_chunk:
-          try:
+    params = {'limit': 250, 'status': 'any', 'created_at_min': today_date}
+    if since_id:
+      params['since_id'] = since_id
+
+    for orders_chunk in instance._fetch_pages('2024-10/orders.json', 'orders', params):
+      if not orders_chunk:
+        break
+
+      total_orders += len(orders_chunk)
+
+      # Load the existing mappings of the whole chunk in one query
+      shopify_ids = [str(o['id']) for o in orders_chunk]
+      mapping_by_sid = {
+          mapping.shopify_order_id: mapping
+          for mapping in self.search([('shopify_order_id', 'in', shopify_ids),
+                                      ('instance_id', '=', instance.id)])
+      }
+      # Orders imported before their mapping existed are recognised by their reference
+      order_by_ref = {}
+      for order in self.env['sale.order'].search(
+          [('client_order_ref', 'in', [f"Shopify-{sid}" for sid in shopify_ids
+                                       if sid not in mapping_by_sid])],
+          order='id'):
+        order_by_ref.setdefault(order.client_order_ref, order)
+      mapping_by_order_id = {}
+      for mapping in self.search([('odoo_order_id', 'in', [o.id for o in order_by_ref.values()]),
+                                  ('instance_id', '=', instance.id)]):
+        mapping_by_order_id.setdefault(mapping.odoo_order_id.id, mapping)
+
+      # Load the customers, products and currencies referenced by the chunk the same way
+      partner_by_email = self._resolve_partners(orders_chunk)
+      product_by_external_id = self._resolve_products(orders_chunk)
+      self._resolve_currencies(orders_chunk, currency_by_code)
+
+      for shopify_order in orders_chunk:
+        new_customer_email = None
+        pos_notification = None
+        # Each order is imported in its own savepoint, a failing one leaves no partial records
+        try:
+          with self.env.cr.savepoint():
+            sid = str(shopify_order['id'])
             # Check if order already exists - VALIDATION TO PREVENT DUPLICATES
-            existing_mapping = self.search([('shopify_order_id', '=', str(shopify_order['id'])),
-                                            ('instance_id', '=', instance.id)],
-                                           limit=1)
+            existing_mapping = mapping_by_sid.get(sid)
 
             # Additional validation: Check if the order number already exists
             if not existing_mapping:
               order_number = shopify_order.get('name') or shopify_order.get('order_number')
               if order_number:
                 # Search for orders with the same reference
-                existing_order = self.env['sale.order'].search(
-                    [('client_order_ref', '=', f"Shopify-{shopify_order['id']}")], limit=1)
+                existing_order = order_by_ref.get(f"Shopify-{sid}")
                 if existing_order:
                   # Find or create mapping for this order
-                  existing_mapping = self.search([('odoo_order_id', '=', existing_order.id),
-                                                  ('instance_id', '=', instance.id)],
-                                                 limit=1)
+                  existing_mapping = mapping_by_order_id.get(existing_order.id)
                   if not existing_mapping:
                     # Create mapping if it doesn't exist
                     existing_mapping = self.create({
-                        'shopify_order_id': str(shopify_order['id']),
+                        'shopify_order_id': sid,
                         'odoo_order_id': existing_order.id,
                         'instance_id': instance.id,
                         'sync_status': 'synced',
                     })
-                  _logger.info(f"Found existing order by reference: Shopify-{shopify_order['id']}")
+                  _logger.info(f"Found existing order by reference: Shopify-{sid}")
 
             currency = False
             currency_code = shopify_order.get('currency') or shopify_order.get(
                 'presentment_currency')
             if currency_code:
-              currency = self.env['res.currency'].search([('name', '=', currency_code)], limit=1)
+              currency = currency_by_code.get(currency_code, False)
               if not currency:
                 _logger.warning('Currency %s from Shopify order %s not found in Odoo',
                                 currency_code, shopify_order.get('name'))
@@ -183,150 +208,209 @@ class ShopifyOrder(models.Model):
               # Get or create customer
               customer_email = shopify_order.get('email', '') or shopify_order.get(
                   'contact_email', '')
-              customer_data = shopify_order.get('customer', {})
+              customer = partner_by_email.get(customer_email) if customer_email else None
 
-              # Try to get customer name from billing address or customer data
-              customer_name = 'Unknown Customer'
-              billing_address = shopify_order.get('billing_address', {})
-              if billing_address:
-                first_name = billing_address.get('first_name', '')
-                last_name = billing_address.get('last_name', '')
-                if first_name or last_name:
-                  customer_name = f"{first_name} {last_name}".strip()
+              if not customer:
+                customer = import_env['res.partner'].create(
+                    self._build_partner_vals(shopify_order, customer_email))
+                if customer_email:
+                  partner_by_email[customer_email] = customer
+                  new_customer_email = customer_email
 
-              customer = None
-              if customer_email:
-                customer = self.env['res.partner'].search([('email', '=', customer_email)], limit=1)
+              config_id = self._get_pos_config_for_address(shopify_order, instance,
+                                                           config_by_location)
 
-              if not customer:
-                customer = self.env['res.partner'].create({
-                    'name': customer_name,
-                    'email': customer_email or '',
-                    'is_company': False,
-                })
+              # Reuse the resolved config instead of asking Shopify a second time
+              warehouse = self._get_pos_warehouse_for_address(shopify_order, instance, config_id)
 
-              created_at = shopify_order.get('created_at')
-              if created_at:
-                # Parse ISO 8601 format and convert to Odoo format
-                from datetime import datetime
-                try:
-                  if 'T' in created_at:
-                    # Remove timezone part for now (could be improved later)
-                    date_part = created_at.split('T')[0]
-                    time_part = created_at.split('T')[1].split('-')[0].split('+')[0]
-                    created_at = f"{date_part} {time_part}"
-                except:
-                  created_at = None
-
-              config_id = self._get_pos_config_for_address(shopify_order, instance)
-
-              warehouse = self._get_pos_warehouse_for_address(shopify_order, instance)
-
-              order_vals = {
-                  'partner_id': customer.id if customer else self.env.ref('base.partner_admin').id,
-                  'date_order': created_at,
-                  'client_order_ref': f"Shopify-{shopify_order['id']}",
-                  'note': f"Imported from Shopify Order #{shopify_order['id']}",
-                  'shopify_order_source': 'shopify',
-                  'shopify_sync_enabled': True,
-                  'state': 'draft',
-                  'config_id': config_id.id if config_id else False,
-                  'warehouse_id': warehouse.id if warehouse else False,
-              }
+              order_vals = self._build_order_vals(shopify_order, customer or default_partner,
+                                                  config_id, warehouse)
               # if currency:
               #   order_vals['currency_id'] = currency.id
-              odoo_order = self.env['sale.order'].create(order_vals)
-              created_count += 1
+              odoo_order = import_env['sale.order'].create(order_vals)
 
-              # Send notification to POS about new Shopify order
+              # Notify the POS about the new Shopify order once it is fully imported,
+              # bus messages are not undone by a savepoint rollback
               if config_id:
-                notification_data = {
+                pos_notification = (config_id, {
                     'order_id': odoo_order.id,
                     'order_name': odoo_order.name,
                     'partner_name': customer.name if customer else 'Unknown',
                     'shopify_order_id': shopify_order['id'],
                     'amount_total': shopify_order.get('total_price', 0),
-                }
-                config_id._notify_shopify_orders('SHOPIFY_ORDER_CREATE', notification_data)
+                })
 
-            if odoo_order.shopify_order_source == 'shopify' and odoo_order.order_line:
+            # Orders created just above have no lines yet, only re-imported ones are checked.
+            # Stale lines go inside the savepoint, so a failing order keeps its previous lines.
+            if (existing_mapping and odoo_order.shopify_order_source == 'shopify' and
+                odoo_order.order_line):
               odoo_order.order_line.unlink()
 
-            # Process line items for both new and existing orders
-            line_items = shopify_order.get('line_items', [])
-            refunded_list = []
-
-            for refund in shopify_order.get('refunds', []):
-              for refund_item in refund.get('refund_line_items', []):
-                refunded = refund_item.get('line_item').get('product_id', False)
-                refunded_list.append(refunded)
-
-            for item in line_items:
-
-              product = None
-              product_id = item.get('product_id')
-
-              if product_id in refunded_list:
-                continue
-
-              if product_id:
-                product = self.env['product.product'].search([
-                    ('shopify_product_external_id', '=', str(product_id)),
-                    ('active', '=', True),
-                ],
-                                                             limit=1)
-
-              # Create order line
-              line_price = float(item.get('price', 0))
-              line_qty = int(item.get('quantity', 1)) or 1
-              discount_total = 0.0
-              for allocation in item.get('discount_allocations', []) or []:
-                try:
-                  discount_total += float(allocation.get('amount', 0))
-                except (TypeError, ValueError):
-                  continue
-              if discount_total and line_qty:
-                line_price -= (discount_total / line_qty)
-
-              self.env['sale.order.line'].create({
-                  'order_id': odoo_order.id,
-                  'product_id': product.id,
-                  'name': item.get('name', product.name),
-                  'product_uom_qty': line_qty,
-                  'price_unit': line_price,
-                  'tax_id': [(5, 0, 0)],
-              })
-
-          except Exception as e:
-            error_count += 1
-
-        if len(orders_chunk) < 250:
-          break
-        # last_id = orders_chunk[-1].get('id')
-
-      return all_orders
-    except Exception as e:
-      raise UserError(_(f'Exception during order import: {str(e)}'))
+            # Process line items for both new and existing orders, all lines at once
+            import_env['sale.order.line'].create(
+                self._build_line_vals_list(shopify_order, odoo_order, product_by_external_id))
+
+          if existing_mapping:
+            updated_count += 1
+          else:
+            created_count += 1
+          if pos_notification:
+            config, notification_data = pos_notification
+            config._notify_shopify_orders('SHOPIFY_ORDER_CREATE', notification_data)
+        except Exception:
+          error_count += 1
+          _logger.exception('Failed to import Shopify order %s', shopify_order.get('id'))
+          # The partner created for this order was rolled back with it
+          if new_customer_email:
+            partner_by_email.pop(new_customer_email, None)
+
+    return {
+        'created': created_count,
+        'updated': updated_count,
+        'errors': error_count,
+        'total': total_orders,
+    }
+
+  def _resolve_partners(self, orders_chunk):
+    """Return the existing partners of the orders' customers, keyed by email."""
+    emails = {o.get('email') or o.get('contact_email') for o in orders_chunk} - {None, ''}
+    partner_by_email = {}
+    for partner in self.env['res.partner'].search([('email', 'in', list(emails))], order='id'):
+      partner_by_email.setdefault(partner.email, partner)
+    return partner_by_email
+
+  def _resolve_products(self, orders_chunk):
+    """Return the products sold by the orders, keyed by their Shopify product ID."""
+    product_ids = {
+        str(item['product_id'])
+        for o in orders_chunk
+        for item in o.get('line_items', [])
+        if item.get('product_id')
+    }
+    product_by_external_id = {}
+    for product in self.env['product.product'].search(
+        [('shopify_product_external_id', 'in', list(product_ids)), ('active', '=', True)],
+        order='id'):
+      product_by_external_id.setdefault(product.shopify_product_external_id, product)
+    return product_by_external_id
+
+  def _resolve_currencies(self, orders_chunk, currency_by_code):
+    """Add the currencies of the orders missing from ``currency_by_code``, False if unknown."""
+    currency_codes = {
+        o.get('currency') or o.get('presentment_currency') for o in orders_chunk
+    } - {None, ''} - currency_by_code.keys()
+    if not currency_codes:
+      return
+    for currency in self.env['res.currency'].search([('name', 'in', list(currency_codes))],
+                                                    order='id'):
+      currency_by_code.setdefault(currency.name, currency)
+    for currency_code in currency_codes:
+      currency_by_code.setdefault(currency_code, False)
+
+  def _build_partner_vals(self, shopify_order, customer_email):
+    """Return the values of the partner created for a Shopify order's customer."""
+    # Try to get customer name from billing address or customer data
+    customer_name = 'Unknown Customer'
+    billing_address = shopify_order.get('billing_address', {})
+    if billing_address:
+      first_name = billing_address.get('first_name', '')
+      last_name = billing_address.get('last_name', '')
+      if first_name or last_name:
+        customer_name = f"{first_name} {last_name}".strip()
+
+    return {
+        'name': customer_name,
+        'email': customer_email or '',
+        'is_company': False,
+    }
+
+  def _build_order_vals(self, shopify_order, customer, config, warehouse):
+    """Return the values of the sale order created for a Shopify order."""
+    sid = str(shopify_order['id'])
+    created_at = shopify_order.get('created_at')
+    if created_at:
+      # Parse ISO 8601 format and convert to Odoo's naive UTC datetimes
+      try:
+        created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        if created_at.tzinfo:
+          created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+      except ValueError:
+        created_at = None
+
+    return {
+        'partner_id': customer.id,
+        'date_order': created_at,
+        'client_order_ref': f"Shopify-{sid}",
+        'note': f"Imported from Shopify Order #{sid}",
+        'shopify_order_source': 'shopify',
+        'shopify_sync_enabled': True,
+        'state': 'draft',
+        'config_id': config.id if config else False,
+        'warehouse_id': warehouse.id if warehouse else False,
+    }
+
+  def _build_line_vals_list(self, shopify_order, odoo_order, product_by_external_id):
+    """Return the values of the order lines for the non-refunded Shopify line items."""
+    refunded_products = set()
+    for refund in shopify_order.get('refunds', []):
+      for refund_item in refund.get('refund_line_items', []):
+        refunded_products.add(refund_item.get('line_item').get('product_id', False))
+
+    line_vals_list = []
+    for item in shopify_order.get('line_items', []):
+      product = None
+      product_id = item.get('product_id')
+
+      if product_id in refunded_products:
+        continue
+
+      if product_id:
+        product = product_by_external_id.get(str(product_id))
+
+      # Create order line
+      line_price = float(item.get('price', 0))
+      line_qty = int(item.get('quantity', 1)) or 1
+      # Shopify always sends allocation amounts as decimal strings
+      discount_total = sum(
+          float(allocation.get('amount') or 0)
+          for allocation in item.get('discount_allocations') or ())
+      if discount_total and line_qty:
+        line_price -= (discount_total / line_qty)
+
+      line_vals_list.append({
+          'order_id': odoo_order.id,
+          'product_id': product.id,
+          'name': item.get('name', product.name),
+          'product_uom_qty': line_qty,
+          'price_unit': line_price,
+          'tax_id': [(5, 0, 0)],
+      })
+    return line_vals_list
 
   @api.model
   def _run_order_import_cron(self):
     instances = self.env['shopify.instance'].search([('active', '=', True),
                                                      ('state', '=', 'connected')])
+    # Get the last imported order ID of all instances at once to fetch only new orders.
+    # Ids are compared as numbers, as text '999' would sort after '1000'.
+    self.flush_model(['shopify_order_id', 'instance_id', 'active'])
+    self.env.cr.execute(
+        """SELECT instance_id, MAX(shopify_order_id::bigint) FROM shopify_order
+           WHERE instance_id = ANY(%s) AND active AND shopify_order_id ~ '^[0-9]+$'
+           GROUP BY instance_id""", (instances.ids,))
+    last_order_ids = dict(self.env.cr.fetchall())
     for instance in instances:
-      # Get the last imported order ID for this instance to fetch only new orders
-      last_order_mapping = self.search([('instance_id', '=', instance.id)],
-                                       order='shopify_order_id desc',
-                                       limit=1)
-      since_id = None
-      if last_order_mapping and last_order_mapping.shopify_order_id:
-        try:
-          since_id = int(last_order_mapping.shopify_order_id)
-          _logger.info(
-              f"Starting order import for instance {instance.name} from order ID: {since_id}")
-        except (ValueError, TypeError):
-          _logger.warning(f"Could not parse last order ID: {last_order_mapping.shopify_order_id}")
-
-      self.import_orders_from_shopify(instance, since_id=since_id)
+      since_id = last_order_ids.get(instance.id)
+      if since_id:
+        _logger.info(
+            f"Starting order import for instance {instance.name} from order ID: {since_id}")
+
+      # Isolate each shop, so a failing one neither rolls back nor blocks the others
+      try:
+        with self.env.cr.savepoint():
+          self.import_orders_from_shopify(instance, since_id=since_id)
+      except Exception:
+        _logger.exception('Order import failed for Shopify instance %s', instance.name)
 
   def sync_order_from_shopify(self, instance):
     """Bi-directional sync: Update Odoo order with latest Shopify data"""
@@ -339,12 +423,7 @@ class ShopifyOrder(models.Model):
     url = f"{instance.shop_url}/admin/api/2024-10/orders/{self.shopify_order_id}.json"
 
     try:
-      headers = {'Content-Type': 'application/json'}
-      if hasattr(instance, 'access_token') and instance.access_token:
-        headers['X-Shopify-Access-Token'] = instance.access_token
-        response = requests.get(url, headers=headers, timeout=20)
-      else:
-        response = requests.get(url, auth=(instance.api_key, instance.password), timeout=20)
+      response = instance._get_session().get(url, timeout=20)
 
       if response.status_code == 200:
         shopify_order = response.json().get('order', {})
@@ -430,19 +509,16 @@ class ShopifyOrder(models.Model):
         }
     }
 
-  def _get_pos_config_for_address(self, shopify_order, instance):
+  def _get_pos_config_for_address(self, shopify_order, instance, config_by_location=None):
     order_id = shopify_order.get('id', False)
     pos_config = False
 
     base_url = f"{instance.shop_url}/admin/api/2024-10/orders/{order_id}/fulfillment_orders.json?limit=1"
 
     try:
-      headers = {'Content-Type': 'application/json'}
-      if hasattr(instance, 'access_token') and instance.access_token:
-        headers['X-Shopify-Access-Token'] = instance.access_token
-        response = requests.get(base_url, headers=headers, timeout=20)
-      else:
-        response = requests.get(base_url, auth=(instance.api_key, instance.password), timeout=20)
+      # Called once per imported order: reuse the keep-alive connections, but do not retry,
+      # an unresponsive shop must not hold every order for several timeouts
+      response = instance._get_session(max_retries=0).get(base_url, timeout=20)
 
       if response.status_code != 200:
         _logger.error(
@@ -458,9 +534,14 @@ class ShopifyOrder(models.Model):
           location_id = fulfillment_orders[0].get('assigned_location', {}).get('location_id', False)
   
         if location_id:
-          pos_config = self.env['pos.config'].search(
-              [('shopify_location_id', '=', str(location_id))],
-              limit=1)
+          # Callers importing many orders pass a dict to search each location only once
+          if config_by_location is None:
+            config_by_location = {}
+          location_id = str(location_id)
+          if location_id not in config_by_location:
+            config_by_location[location_id] = self.env['pos.config'].search(
+                [('shopify_location_id', '=', location_id)], limit=1, order='id')
+          pos_config = config_by_location[location_id]
           if pos_config:
             return pos_config
   
@@ -469,8 +550,9 @@ class ShopifyOrder(models.Model):
 
     return False
 
-  def _get_pos_warehouse_for_address(self, shopify_order, instance):
-    config = self._get_pos_config_for_address(shopify_order, instance)
+  def _get_pos_warehouse_for_address(self, shopify_order, instance, config=None):
+    if config is None:
+      config = self._get_pos_config_for_address(shopify_order, instance)
 
     if config and config.picking_type_id:
       return config.picking_type_id.warehouse_id
@@ -4,6 +4,7 @@ import logging
 import time
 from odoo.exceptions import UserError, ValidationError
 from odoo.tools.translate import _
+from odoo.tools.sql import create_index
 
 _logger = logging.getLogger(__name__)
 
@@ -82,6 +83,11 @@ class ShopifyProduct(models.Model):
        'This Shopify variant is already mapped for this instance!'),
   ]
 
+  def init(self):
+    # Mapping lookups always filter on both the Odoo product and the instance
+    create_index(self._cr, 'shopify_product_odoo_product_instance_idx', self._table,
+                 ['odoo_product_id', 'instance_id'])
+
   def import_products_from_shopify(self, instance):
     if not instance:
       raise UserError(_('No Shopify instance provided.'))
@@ -132,6 +138,24 @@ class ShopifyProduct(models.Model):
 
     # Iterate batches to process 100 products at a time
     for batch in product_batches:
+      # Resolve the SKU and name fallbacks of the whole batch up front, SKU first
+      skus = set()
+      titles = set()
+      for shopify_product in batch:
+        titles.add(shopify_product.get('title'))
+        variants = shopify_product.get('variants', [])
+        if isinstance(variants, dict):
+          variants = variants.get('nodes', []) or []
+        skus.update(shopify_variant.get('sku') for shopify_variant in variants)
+      skus -= {None, ''}
+      titles -= {None, ''}
+      variant_by_code = {}
+      for product in self.env['product.product'].search([('default_code', 'in', list(skus))]):
+        variant_by_code.setdefault(product.default_code, product)
+      variant_by_name = {}
+      for product in self.env['product.product'].search([('name', 'in', list(titles))]):
+        variant_by_name.setdefault(product.name, product)
+
       for shopify_product in batch:
         try:
           existing_template = False
@@ -174,12 +198,8 @@ class ShopifyProduct(models.Model):
                                                                     limit=1)
 
             if not existing_variant:
-              existing_variant = self.env['product.product'].search([
-                  '|',
-                  ('default_code', '=', shopify_variant.get('sku', '')),
-                  ('name', '=', shopify_product.get('title')),
-              ],
-                                                                    limit=1)
+              existing_variant = (variant_by_code.get(shopify_variant.get('sku')) or
+                                  variant_by_name.get(shopify_product.get('title')))
             if existing_variant and (not existing_variant.shopify_external_id or
                                      not existing_variant.shopify_product_external_id):
               self.env['product.product'].browse(existing_variant.id).write({